@@ -1,14 +1,48 @@
-from flask import Flask, request, jsonify
-from transformers import AutoModelForCausalLM, AutoTokenizer
-import torch
 import os
 from dotenv import load_dotenv
-import logging
 
 # Load environment variables from .env file
 load_dotenv()
 
-app = Flask(__name__)
+# Persist compiled Inductor kernels across restarts. These must be set before
+# torch is imported; point TORCHINDUCTOR_CACHE_DIR at a writable volume.
+os.environ.setdefault("TORCHINDUCTOR_CACHE_DIR", "/var/cache/thin_mode/inductor")
+os.environ.setdefault("TORCHINDUCTOR_FX_GRAPH_CACHE", "1")
+os.environ.setdefault("TORCH_COMPILE_DEBUG", "0")
+
+from fastapi import FastAPI, Request
+from fastapi.responses import ORJSONResponse, StreamingResponse
+from pydantic import BaseModel, Field, ValidationError, model_validator
+from starlette.concurrency import iterate_in_threadpool
+from transformers import (
+    AutoModelForCausalLM,
+    AutoTokenizer,
+    BitsAndBytesConfig,
+    DynamicCache,
+    StaticCache,
+    StoppingCriteria,
+    StoppingCriteriaList,
+    GenerationConfig,
+    TextIteratorStreamer
+)
+from transformers.tokenization_utils_base import VERY_LARGE_INTEGER
+from collections import OrderedDict
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Optional
+import asyncio
+import copy
+import orjson
+import torch
+import queue
+import threading
+import time
+from export_engine import engine_path, export_onnx
+import logging
+import uvicorn
+
+app = FastAPI(title="LLM API", version="1.0.0", default_response_class=ORJSONResponse)
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -20,120 +54,774 @@ HOST = os.getenv("HOST", "0.0.0.0")
 PORT = int(os.getenv("PORT", "5000"))
 MAX_TOKENS_DEFAULT = int(os.getenv("MAX_TOKENS_DEFAULT", "50"))
 MAX_TOKENS_LIMIT = int(os.getenv("MAX_TOKENS_LIMIT", "500"))
+MAX_PROMPT_TOKENS = int(os.getenv("MAX_PROMPT_TOKENS", "1024"))
+BACKEND = os.getenv("BACKEND", "pt").lower()
+ENGINE_DIR = os.getenv("ENGINE_DIR", "engine_cache")
+COMPILE_MODEL = os.getenv("COMPILE_MODEL", "false").lower() == "true"
+DTYPE = os.getenv("DTYPE", "bf16").lower()
+QUANT = os.getenv("QUANT", "none").lower()
+# Eager decoding attends over the whole static cache, so it only pays off compiled
+STATIC_CACHE = os.getenv("STATIC_CACHE", str(COMPILE_MODEL)).lower() == "true"
+SESSION_CACHE_MB = int(os.getenv("SESSION_CACHE_MB", "1024"))
+MAX_BATCH_SIZE = int(os.getenv("MAX_BATCH_SIZE", "8"))
+BATCH_WAIT_MS = int(os.getenv("BATCH_WAIT_MS", "10"))
+WARMUP_PROMPT = "Hello, world"
+WARMUP_MAX_TOKENS = 8
+DISCONNECT_POLL_SECONDS = 0.1
+DEVICE = "cuda" if torch.cuda.is_available() else "cpu"
 
 # Global variables for model and tokenizer
 model = None
 tokenizer = None
+model_loaded = False
+model_load_lock = threading.Lock()
+base_generation_config = None
+kv_bytes_per_token = 0
+# Quantization actually applied at load, which may differ from QUANT
+quantization = "none"
+
+# Preallocated KV cache for single-prompt batches
+static_cache = None
+
+# Pinned host buffers batches are padded into before their copy to the GPU
+input_ids_stage = None
+attention_mask_stage = None
+copy_stream = None
+stage_copied = None
+
+# Per-session KV caches, least recently used first:
+# session_id -> (past_key_values, prior_text, prior_ids)
+SESSION_CACHE = OrderedDict()
+
+# Pending generation jobs, drained by a single batch worker thread. The worker
+# is the only thread that runs generation, so the caches above need no locks.
+request_queue = queue.Queue()
+batch_worker = None
+batch_worker_lock = threading.Lock()
+
+class GenerateRequest(BaseModel):
+    """JSON body accepted by /generate"""
+    prompt: str = ""
+    max_tokens: int = Field(MAX_TOKENS_DEFAULT, ge=1)
+    do_sample: bool = True
+    temperature: float = Field(1.0, ge=0)
+    top_p: float = Field(1.0, gt=0, le=1)
+    session_id: Optional[str] = None
+    stream: bool = False
+
+    @model_validator(mode="after")
+    def check_temperature(self):
+        """Greedy decoding ignores temperature, so 0 is only invalid when sampling"""
+        if self.do_sample and self.temperature == 0:
+            raise ValueError("temperature must be greater than 0 when do_sample is true")
+        return self
+
+@dataclass
+class GenerationJob:
+    """A queued /generate request and the future its result is delivered on"""
+    prompt: str
+    max_tokens: int
+    do_sample: bool
+    temperature: float
+    top_p: float
+    session_id: str = None
+    streamer: TextIteratorStreamer = None
+    future: Future = field(default_factory=Future)
+    cancel_event: threading.Event = field(default_factory=threading.Event)
+
+    def batch_key(self):
+        """Jobs with equal keys can share one model.generate call
+
+        max_tokens is left out: each row stops at its own limit.
+        """
+        return (self.do_sample, self.temperature, self.top_p)
+
+class CancelCriteria(StoppingCriteria):
+    """Stop each batch row once its cancellation event is set"""
+
+    def __init__(self, events):
+        self.events = events
+
+    def __call__(self, input_ids, scores, **kwargs):
+        return torch.tensor([event.is_set() for event in self.events], dtype=torch.bool, device=input_ids.device)
+
+class RowMaxTokensCriteria(StoppingCriteria):
+    """Stop each batch row once it has generated its own max_tokens"""
+
+    def __init__(self, max_tokens, prompt_len):
+        self.max_tokens = max_tokens
+        self.prompt_len = prompt_len
+
+    def __call__(self, input_ids, scores, **kwargs):
+        generated = input_ids.shape[1] - self.prompt_len
+        return torch.tensor([generated >= limit for limit in self.max_tokens], dtype=torch.bool, device=input_ids.device)
+
+def resolve_dtype():
+    """Map DTYPE to a torch dtype, falling back where the hardware lacks support"""
+    if DTYPE not in ("bf16", "fp16", "fp32"):
+        raise ValueError(f"Unsupported DTYPE '{DTYPE}', expected one of: bf16, fp16, fp32")
+    if DTYPE == "fp32":
+        return torch.float32
+    
+    # Inference runs on CPU without CUDA (including MPS hosts), where half
+    # precision kernels are slow or missing, so keep full precision there
+    if not torch.cuda.is_available():
+        logger.warning(f"DTYPE={DTYPE} is not supported without CUDA, falling back to fp32")
+        return torch.float32
+    
+    if DTYPE == "bf16" and not torch.cuda.is_bf16_supported():
+        logger.warning("bf16 is not supported on this GPU, falling back to fp16")
+        return torch.float16
+    return torch.bfloat16 if DTYPE == "bf16" else torch.float16
+
+def build_quantization_config(torch_dtype):
+    """Build the weight-only quantization config for QUANT, or None to load full weights"""
+    if QUANT == "none":
+        return None
+    if QUANT not in ("int8", "int4"):
+        raise ValueError(f"Unsupported QUANT '{QUANT}', expected one of: none, int8, int4")
+    
+    # bitsandbytes kernels are CUDA only
+    if not torch.cuda.is_available():
+        logger.warning(f"QUANT={QUANT} requires CUDA, loading unquantized weights")
+        return None
+    
+    if QUANT == "int8":
+        return BitsAndBytesConfig(load_in_8bit=True)
+    return BitsAndBytesConfig(
+        load_in_4bit=True,
+        bnb_4bit_compute_dtype=torch_dtype,
+        bnb_4bit_quant_type="nf4"
+    )
+
+def load_pt_model():
+    """Load the PyTorch model
+
+    Weights are loaded in DTYPE (bf16 by default). Quantized checkpoints may
+    still mix bf16 scales with int8 weights, so model.dtype reports the
+    compute dtype rather than the storage type of every tensor.
+    """
+    global quantization
+    torch_dtype = resolve_dtype()
+    quantization_config = build_quantization_config(torch_dtype)
+    quantization = QUANT if quantization_config is not None else "none"
+    return AutoModelForCausalLM.from_pretrained(
+        MODEL_NAME,
+        torch_dtype=torch_dtype,
+        quantization_config=quantization_config,
+        device_map="auto" if DEVICE == "cuda" else None
+    )
+
+def load_ort_model():
+    """Load the ONNX Runtime model, exporting it to ENGINE_DIR on first use"""
+    from optimum.onnxruntime import ORTModelForCausalLM
+    
+    path = engine_path(MODEL_NAME, ENGINE_DIR)
+    provider = "CUDAExecutionProvider" if DEVICE == "cuda" else "CPUExecutionProvider"
+    if not os.path.isdir(path):
+        logger.info(f"No cached ONNX engine in {path}, exporting {MODEL_NAME}")
+        return export_onnx(MODEL_NAME, path, provider)
+    
+    logger.info(f"Loading cached ONNX engine from {path}")
+    return ORTModelForCausalLM.from_pretrained(path, provider=provider)
+
+def load_vllm_model():
+    """Start a vLLM engine, whose paged KV cache lets sequences finish independently"""
+    from vllm import LLM
+    
+    return LLM(model=MODEL_NAME, dtype=resolve_dtype(), enable_prefix_caching=True)
 
 def load_model():
-    """Load the model and tokenizer"""
-    global model, tokenizer
+    """Load the model and tokenizer for the configured BACKEND"""
+    global model, tokenizer, base_generation_config, kv_bytes_per_token, static_cache
+    global input_ids_stage, attention_mask_stage, copy_stream, stage_copied
     try:
-        logger.info(f"Loading model: {MODEL_NAME}")
-        tokenizer = AutoTokenizer.from_pretrained(MODEL_NAME)
-        model = AutoModelForCausalLM.from_pretrained(MODEL_NAME)
-        
-        # Add padding token if it doesn't exist
-        if tokenizer.pad_token is None:
-            tokenizer.pad_token = tokenizer.eos_token
-            model.config.pad_token_id = model.config.eos_token_id
+        logger.info(f"Loading model: {MODEL_NAME} (backend: {BACKEND})")
+        if BACKEND == "trt":
+            raise ValueError("BACKEND=trt is not supported: TensorRT-LLM engines have no generate() compatible with transformers")
+        if BACKEND not in ("pt", "ort", "vllm"):
+            raise ValueError(f"Unsupported BACKEND '{BACKEND}', expected one of: pt, ort, vllm")
+        
+        tokenizer = AutoTokenizer.from_pretrained(MODEL_NAME, use_fast=True)
+        if not tokenizer.is_fast:
+            raise RuntimeError(f"No fast (Rust) tokenizer available for {MODEL_NAME}")
+        encode_prompt.cache_clear()
+        
+        # vLLM schedules and pads its own batches
+        if BACKEND == "vllm":
+            model = load_vllm_model()
+        else:
+            model = load_pt_model() if BACKEND == "pt" else load_ort_model()
+            
+            # Add padding token if it doesn't exist
+            if tokenizer.pad_token is None:
+                tokenizer.pad_token = tokenizer.eos_token
+                model.config.pad_token_id = model.config.eos_token_id
+            
+            # Built once and cloned per batch instead of passing loose generate kwargs
+            if getattr(model, "generation_config", None) is not None:
+                base_generation_config = copy.deepcopy(model.generation_config)
+            else:
+                base_generation_config = GenerationConfig.from_model_config(model.config)
+            base_generation_config.pad_token_id = tokenizer.pad_token_id
+
+        # Exported engines are already optimized ahead of time
+        if BACKEND == "pt":
+            model.eval()
+            kv_bytes_per_token = kv_cache_bytes_per_token()
+
+            # A fixed-shape cache lets the compiled forward be captured once instead of
+            # recompiling as a dynamic cache grows every decode step
+            if STATIC_CACHE:
+                if model._supports_static_cache:
+                    max_cache_len = MAX_PROMPT_TOKENS + MAX_TOKENS_LIMIT
+                    static_cache = StaticCache(
+                        config=model.config,
+                        max_batch_size=1,
+                        max_cache_len=max_cache_len,
+                        device=model.device,
+                        dtype=model.dtype
+                    )
+                    logger.info(f"Allocated static KV cache for {max_cache_len} tokens")
+                else:
+                    logger.info(f"Model {MODEL_NAME} does not support a static KV cache, using a dynamic cache")
+
+            # Page-locked staging lets input copies run asynchronously on their own stream.
+            # Longer prompts are copied from pageable memory instead.
+            if DEVICE == "cuda":
+                stage_len = min(MAX_PROMPT_TOKENS, model_context_length() or MAX_PROMPT_TOKENS)
+                input_ids_stage = torch.empty((MAX_BATCH_SIZE, stage_len), dtype=torch.long, pin_memory=True)
+                attention_mask_stage = torch.empty_like(input_ids_stage, pin_memory=True)
+                copy_stream = torch.cuda.Stream()
+                stage_copied = torch.cuda.Event()
+
+            # Compile the forward pass so decode steps run fused kernels; generate()
+            # itself stays eager and calls into the compiled forward on every step
+            if COMPILE_MODEL:
+                logger.info("Compiling model with torch.compile")
+                model.forward = torch.compile(model.forward, mode="reduce-overhead", fullgraph=False, dynamic=True)
+                warmup_model()
             
         logger.info(f"Model {MODEL_NAME} loaded successfully")
     except Exception as e:
         logger.error(f"Failed to load model {MODEL_NAME}: {str(e)}")
         raise
 
-@app.route("/", methods=["GET"])
-def health_check():
+def model_context_length():
+    """Longest prompt the model accepts, capped by its position embeddings, or None when unknown"""
+    lengths = [getattr(model.config, "max_position_embeddings", None)]
+    # Tokenizers without a configured limit report a huge sentinel instead
+    if tokenizer.model_max_length < VERY_LARGE_INTEGER:
+        lengths.append(tokenizer.model_max_length)
+    lengths = [length for length in lengths if length]
+    return min(lengths) if lengths else None
+
+def ensure_model_loaded():
+    """Load the model once per process, no matter how many callers race to it"""
+    global model_loaded
+    with model_load_lock:
+        if not model_loaded:
+            load_model()
+            model_loaded = True
+
+def kv_cache_bytes_per_token():
+    """Bytes of KV cache per token: 2 (K and V) * heads * head_dim * layers * bytes per element"""
+    config = model.config
+    num_kv_heads = getattr(config, "num_key_value_heads", None) or config.num_attention_heads
+    head_dim = config.hidden_size // config.num_attention_heads
+    element_size = torch.tensor([], dtype=model.dtype).element_size()
+    return 2 * num_kv_heads * head_dim * config.num_hidden_layers * element_size
+
+@lru_cache(maxsize=1024)
+def encode_prompt(prompt):
+    """Token ids for a prompt, cached so repeated prompts skip tokenization"""
+    return tuple(tokenizer(prompt, truncation=True).input_ids)
+
+def fill_padded(id_lists, input_ids, attention_mask):
+    """Left-pad token id sequences into the given tensors so every prompt ends where generation starts"""
+    max_len = input_ids.shape[1]
+    input_ids.fill_(tokenizer.pad_token_id)
+    attention_mask.zero_()
+    for i, ids in enumerate(id_lists):
+        input_ids[i, max_len - len(ids):] = torch.tensor(ids, dtype=torch.long)
+        attention_mask[i, max_len - len(ids):] = 1
+    return {"input_ids": input_ids, "attention_mask": attention_mask}
+
+def stage_inputs(id_lists):
+    """Build left-padded model inputs on DEVICE, copying through the pinned buffers when they fit"""
+    batch_size = len(id_lists)
+    max_len = max(len(ids) for ids in id_lists)
+    if input_ids_stage is None or batch_size > input_ids_stage.shape[0] or max_len > input_ids_stage.shape[1]:
+        inputs = fill_padded(
+            id_lists,
+            torch.empty((batch_size, max_len), dtype=torch.long),
+            torch.empty((batch_size, max_len), dtype=torch.long)
+        )
+        if DEVICE == "cuda":
+            inputs = {k: v.to(DEVICE, non_blocking=True) for k, v in inputs.items()}
+        return inputs
+    
+    # Don't overwrite the buffers while the previous batch may still be copying
+    stage_copied.synchronize()
+    # Take a contiguous prefix of the buffers: a strided [:batch_size, :max_len]
+    # slice would be copied through a pageable temporary instead
+    num_elements = batch_size * max_len
+    staged = fill_padded(
+        id_lists,
+        input_ids_stage.view(-1)[:num_elements].view(batch_size, max_len),
+        attention_mask_stage.view(-1)[:num_elements].view(batch_size, max_len)
+    )
+    with torch.cuda.stream(copy_stream):
+        inputs = {k: v.to(DEVICE, non_blocking=True) for k, v in staged.items()}
+        stage_copied.record(copy_stream)
+    
+    # Generation runs on the default stream, which must wait for the copy
+    compute_stream = torch.cuda.current_stream()
+    compute_stream.wait_stream(copy_stream)
+    for tensor in inputs.values():
+        tensor.record_stream(compute_stream)
+    return inputs
+
+def prepare_session_inputs(session_id, prompt):
+    """Tokenize a session prompt, reusing the cached prefix when the prompt extends it"""
+    entry = SESSION_CACHE.pop(session_id, None)
+    if entry is not None:
+        past_key_values, prior_text, prior_ids = entry
+        if prompt.startswith(prior_text):
+            # Only the new part of the prompt needs tokenizing and prefilling
+            delta_ids = tokenizer(prompt[len(prior_text):], return_tensors="pt", add_special_tokens=False).input_ids
+            delta_ids = delta_ids.to(prior_ids.device)
+            input_ids = torch.cat([prior_ids, delta_ids], dim=1)
+            if input_ids.shape[1] <= tokenizer.model_max_length:
+                return input_ids, torch.ones_like(input_ids), past_key_values
+    
+    # Cache miss: start a fresh cache for this session
+    input_ids = torch.tensor([encode_prompt(prompt)], dtype=torch.long)
+    past_key_values = DynamicCache() if model._supports_cache_class else None
+    return input_ids, torch.ones_like(input_ids), past_key_values
+
+def store_session(session_id, past_key_values, text, ids):
+    """Save a session's KV cache, evicting least recently used sessions over the memory budget"""
+    budget = SESSION_CACHE_MB * 1024 * 1024
+    SESSION_CACHE[session_id] = (past_key_values, text, ids)
+    SESSION_CACHE.move_to_end(session_id)
+    used = sum(entry[2].shape[1] for entry in SESSION_CACHE.values()) * kv_bytes_per_token
+    while used > budget and SESSION_CACHE:
+        _, (_, _, evicted_ids) = SESSION_CACHE.popitem(last=False)
+        used -= evicted_ids.shape[1] * kv_bytes_per_token
+
+def trim_session(past_key_values, ids, length):
+    """Cut a session's ids and KV cache back to their first length tokens"""
+    if isinstance(past_key_values, DynamicCache):
+        past_key_values.crop(length)
+    elif past_key_values is not None:
+        past_key_values = tuple(tuple(t[:, :, :length] for t in layer) for layer in past_key_values)
+    return past_key_values, ids[:, :length]
+
+def make_generation_config(max_tokens, do_sample, temperature, top_p):
+    """Clone the base generation config with per-request parameters"""
+    generation_config = copy.copy(base_generation_config)
+    generation_config.max_new_tokens = max_tokens
+    generation_config.do_sample = do_sample
+    generation_config.temperature = temperature
+    generation_config.top_p = top_p
+    return generation_config
+
+def generate_with_static_cache(**kwargs):
+    """Run model.generate on the preallocated static cache"""
+    static_cache.reset()
+    return model.generate(past_key_values=static_cache, **kwargs)
+
+def warmup_model():
+    """Run throwaway generations so compilation happens before real traffic"""
+    logger.info("Warming up model")
+    inputs = stage_inputs([encode_prompt(WARMUP_PROMPT)])
+    generate_fn = generate_with_static_cache if static_cache is not None else model.generate
+    generation_config = make_generation_config(WARMUP_MAX_TOKENS, False, 1.0, 1.0)
+    
+    # The second pass runs on the shapes captured by the first
+    with torch.inference_mode():
+        for _ in range(2):
+            generate_fn(**inputs, generation_config=generation_config)
+    logger.info("Warmup complete")
+
+def end_token_ids(device):
+    """Token ids that end a generated sequence: EOS and padding"""
+    end_ids = [tokenizer.pad_token_id]
+    eos_token_id = base_generation_config.eos_token_id
+    end_ids.extend(eos_token_id if isinstance(eos_token_id, list) else [eos_token_id])
+    return torch.tensor([i for i in end_ids if i is not None], device=device)
+
+def count_generated_tokens(new_tokens):
+    """Count new tokens up to and including the first EOS or padding token
+
+    Rows that finish early in a batch are padded to the longest one, but the
+    EOS that ended a row was generated and counts.
+    """
+    end_positions = torch.isin(new_tokens, end_token_ids(new_tokens.device)).nonzero()
+    if len(end_positions) == 0:
+        return len(new_tokens)
+    return int(end_positions[0]) + 1
+
+def run_batch(jobs):
+    """Generate for jobs sharing generation parameters, returning one result per job"""
+    first = jobs[0]
+    # The batch runs to its longest limit; shorter rows stop on their own
+    max_tokens = max(job.max_tokens for job in jobs)
+    generate_fn = model.generate
+    generate_kwargs = {}
+    
+    # Tokenize input
+    if first.session_id:
+        # Session jobs carry their own cache and always run alone
+        input_ids, attention_mask, past_key_values = prepare_session_inputs(first.session_id, first.prompt)
+        inputs = {"input_ids": input_ids, "attention_mask": attention_mask}
+        if DEVICE == "cuda":
+            inputs = {k: v.to(DEVICE, non_blocking=True) for k, v in inputs.items()}
+        generate_kwargs = {
+            "past_key_values": past_key_values,
+            "use_cache": True,
+            "return_dict_in_generate": True
+        }
+    else:
+        inputs = stage_inputs([encode_prompt(job.prompt) for job in jobs])
+        # Prompts longer than MAX_PROMPT_TOKENS don't fit the static cache
+        fits_static_cache = static_cache is not None and inputs["input_ids"].shape[1] + max_tokens <= static_cache.max_cache_len
+        if fits_static_cache and len(jobs) == 1:
+            generate_fn = generate_with_static_cache
+    
+    # Streaming jobs run alone, so the streamer sees exactly one sequence
+    if first.streamer is not None:
+        generate_kwargs["streamer"] = first.streamer
+    
+    # Every row shares the same left-padded prompt length
+    input_len = inputs['input_ids'].shape[1]
+    
+    # Rows stop decoding at their own max_tokens, or at the next step once
+    # their client went away
+    generate_kwargs["stopping_criteria"] = StoppingCriteriaList([
+        CancelCriteria([job.cancel_event for job in jobs]),
+        RowMaxTokensCriteria([job.max_tokens for job in jobs], input_len)
+    ])
+    
+    # Generate response
+    with torch.inference_mode():
+        outputs = generate_fn(
+            **inputs,
+            generation_config=make_generation_config(max_tokens, first.do_sample, first.temperature, first.top_p),
+            **generate_kwargs
+        )
+    
+    if first.session_id:
+        past_key_values = outputs.past_key_values
+        outputs = outputs.sequences
+    
+    results = []
+    for i, job in enumerate(jobs):
+        # Decode only the new tokens, so the prompt is never decoded again.
+        # Padding past a row's own limit is not part of its output.
+        new_tokens = outputs[i, input_len:input_len + job.max_tokens]
+        response_text = tokenizer.decode(new_tokens, skip_special_tokens=True)
+        full_text = job.prompt + response_text
+        
+        result = {
+            "response": response_text,
+            "full_text": full_text,
+            "model": MODEL_NAME,
+            "tokens_generated": count_generated_tokens(new_tokens)
+        }
+        
+        if job.session_id:
+            # Drop a trailing EOS from the cached context, so the next turn
+            # continues the text the client sees rather than a finished document
+            kept_tokens = result["tokens_generated"]
+            if kept_tokens and torch.isin(new_tokens[kept_tokens - 1], end_token_ids(new_tokens.device)):
+                kept_tokens -= 1
+            past_key_values, session_ids = trim_session(past_key_values, outputs, input_len + kept_tokens)
+            session_text = job.prompt + tokenizer.decode(new_tokens[:kept_tokens], skip_special_tokens=True)
+            store_session(job.session_id, past_key_values, session_text, session_ids)
+            result["session_id"] = job.session_id
+        
+        results.append(result)
+    return results
+
+def run_vllm_batch(jobs):
+    """Generate for jobs on the vLLM engine, returning one result or exception per job"""
+    from vllm import SamplingParams
+    
+    # Each job keeps its own parameters; vLLM retires every sequence at its own end.
+    # Invalid parameters fail only their own job, not the whole batch.
+    results = [None] * len(jobs)
+    runnable = []
+    for i, job in enumerate(jobs):
+        try:
+            sampling_params = SamplingParams(
+                max_tokens=job.max_tokens,
+                temperature=job.temperature if job.do_sample else 0.0,
+                top_p=job.top_p if job.do_sample else 1.0
+            )
+        except ValueError as e:
+            results[i] = e
+            continue
+        runnable.append((i, job, sampling_params))
+    if not runnable:
+        return results
+    
+    prompts = [{"prompt_token_ids": list(encode_prompt(job.prompt))} for _, job, _ in runnable]
+    outputs = model.generate(prompts, [params for _, _, params in runnable], use_tqdm=False)
+    
+    for (i, job, _), output in zip(runnable, outputs):
+        completion = output.outputs[0]
+        results[i] = {
+            "response": completion.text,
+            "full_text": job.prompt + completion.text,
+            "model": MODEL_NAME,
+            "tokens_generated": len(completion.token_ids)
+        }
+    return results
+
+def collect_jobs():
+    """Block for the next job, then gather more for up to BATCH_WAIT_MS"""
+    jobs = [request_queue.get()]
+    deadline = time.monotonic() + BATCH_WAIT_MS / 1000
+    while len(jobs) < MAX_BATCH_SIZE:
+        timeout = deadline - time.monotonic()
+        if timeout <= 0:
+            break
+        try:
+            jobs.append(request_queue.get(timeout=timeout))
+        except queue.Empty:
+            break
+    return jobs
+
+def finish_job(job, result=None, error=None):
+    """Deliver a job's outcome, unless its waiter already cancelled the future"""
+    if not job.future.done():
+        if error is None:
+            job.future.set_result(result)
+        else:
+            job.future.set_exception(error)
+    
+    # Unblock stream consumers waiting on a generation that died
+    if error is not None and job.streamer is not None:
+        job.streamer.end()
+
+def run_jobs(queued_jobs):
+    """Run one round of queued jobs, batching compatible ones together"""
+    jobs = []
+    for job in queued_jobs:
+        # Mark the future running so its waiter can no longer cancel it; False
+        # means it was already cancelled while queued
+        if not job.future.set_running_or_notify_cancel():
+            if job.streamer is not None:
+                job.streamer.end()
+        # Skip jobs whose client disconnected while they were queued
+        elif job.cancel_event.is_set():
+            finish_job(job, error=RuntimeError("Request cancelled"))
+        else:
+            jobs.append(job)
+    if not jobs:
+        return
+    
+    if BACKEND == "vllm":
+        batches = [jobs]
+        run_fn = run_vllm_batch
+    else:
+        batches = []
+        groups = {}
+        for job in jobs:
+            if job.session_id or job.streamer is not None:
+                batches.append([job])
+            else:
+                groups.setdefault(job.batch_key(), []).append(job)
+        batches.extend(groups.values())
+        run_fn = run_batch
+    
+    for batch in batches:
+        try:
+            for job, result in zip(batch, run_fn(batch)):
+                if isinstance(result, Exception):
+                    finish_job(job, error=result)
+                else:
+                    finish_job(job, result)
+        except Exception as e:
+            for job in batch:
+                finish_job(job, error=e)
+
+def batch_worker_loop():
+    """Drain the request queue until the process exits"""
+    while True:
+        try:
+            run_jobs(collect_jobs())
+        except Exception as e:
+            # One bad round must not stop the worker and strand later requests
+            logger.error(f"Batch worker error: {str(e)}")
+
+def ensure_batch_worker():
+    """Start the batch worker thread in this process if it is not running"""
+    global batch_worker
+    with batch_worker_lock:
+        if batch_worker is None or not batch_worker.is_alive():
+            batch_worker = threading.Thread(target=batch_worker_loop, name="batch-worker", daemon=True)
+            batch_worker.start()
+
+async def run_job(job, request=None):
+    """Queue a job for the batch worker and await its result without blocking the event loop
+
+    When the originating request is given, the job is cancelled if its
+    client disconnects while waiting.
+    """
+    ensure_batch_worker()
+    request_queue.put(job)
+    future = asyncio.wrap_future(job.future)
+    if request is None:
+        return await future
+    
+    while not future.done():
+        await asyncio.wait({future}, timeout=DISCONNECT_POLL_SECONDS)
+        if not future.done() and await request.is_disconnected():
+            job.cancel_event.set()
+            break
+    return await future
+
+def sse_event(data):
+    """Encode one Server-Sent Event"""
+    return b"data: " + orjson.dumps(data) + b"\n\n"
+
+async def stream_events(job):
+    """Yield generated text as Server-Sent Events, then a final summary event"""
+    try:
+        async for text in iterate_in_threadpool(job.streamer):
+            if text:
+                yield sse_event({"token": text})
+        result = await asyncio.wrap_future(job.future)
+        yield sse_event({"done": True, **result})
+        
+    except Exception as e:
+        logger.error(f"Error streaming text: {str(e)}")
+        yield sse_event({"error": f"Generation failed: {str(e)}"})
+    finally:
+        # Reached on client disconnect too, stopping the decode loop early
+        job.cancel_event.set()
+
+def validation_error_response(exc):
+    """Report an invalid request body in the API's error format"""
+    error = exc.errors()[0]
+    field_path = ".".join(str(part) for part in error["loc"])
+    # Errors that span several fields have no location
+    if not field_path:
+        return ORJSONResponse({"error": f"Invalid request: {error['msg']}"}, status_code=400)
+    return ORJSONResponse({"error": f"Invalid value for '{field_path}': {error['msg']}"}, status_code=400)
+
+@app.get("/")
+async def health_check():
     """Health check endpoint"""
-    return jsonify({
+    return {
         "status": "healthy",
         "model": MODEL_NAME,
         "version": "1.0.0"
-    })
+    }
 
-@app.route("/generate", methods=["POST"])
-def generate():
+@app.post("/generate")
+async def generate(request: Request):
     """Generate text based on prompt"""
     try:
         # Check if model is loaded
         if model is None or tokenizer is None:
-            return jsonify({"error": "Model not loaded"}), 500
+            return ORJSONResponse({"error": "Model not loaded"}, status_code=500)
         
         # Get request data
-        data = request.get_json()
+        try:
+            data = orjson.loads(await request.body())
+        except orjson.JSONDecodeError:
+            data = None
         if not data:
-            return jsonify({"error": "No JSON data provided"}), 400
+            return ORJSONResponse({"error": "No JSON data provided"}, status_code=400)
         
-        prompt = data.get("prompt", "")
-        if not prompt:
-            return jsonify({"error": "No prompt provided"}), 400
+        try:
+            req = GenerateRequest.model_validate(data)
+        except ValidationError as e:
+            return validation_error_response(e)
         
-        # Get max_tokens with validation
-        max_tokens = data.get("max_tokens", MAX_TOKENS_DEFAULT)
-        if max_tokens > MAX_TOKENS_LIMIT:
-            max_tokens = MAX_TOKENS_LIMIT
-        
-        # Get other generation parameters
-        do_sample = data.get("do_sample", True)
-        temperature = data.get("temperature", 1.0)
-        top_p = data.get("top_p", 1.0)
-        
-        # Tokenize input
-        inputs = tokenizer(prompt, return_tensors="pt", padding=True, truncation=True)
-        
-        # Generate response
-        with torch.no_grad():
-            outputs = model.generate(
-                inputs.input_ids,
-                max_new_tokens=max_tokens,
-                do_sample=do_sample,
-                temperature=temperature,
-                top_p=top_p,
-                pad_token_id=tokenizer.pad_token_id,
-                attention_mask=inputs.attention_mask if 'attention_mask' in inputs else None
-            )
+        if not req.prompt:
+            return ORJSONResponse({"error": "No prompt provided"}, status_code=400)
         
-        # Decode the generated text
-        generated_text = tokenizer.decode(outputs[0], skip_special_tokens=True)
+        if req.session_id and BACKEND != "pt":
+            return ORJSONResponse({"error": "session_id is only supported with BACKEND=pt"}, status_code=400)
         
-        # Remove the original prompt from the response
-        response_text = generated_text[len(prompt):].strip()
+        if req.stream and BACKEND == "vllm":
+            return ORJSONResponse({"error": "stream is not supported with BACKEND=vllm"}, status_code=400)
         
-        return jsonify({
-            "response": response_text,
-            "full_text": generated_text,
-            "model": MODEL_NAME,
-            "tokens_generated": len(outputs[0]) - len(inputs['input_ids'][0])
-        })
+        # Get max_tokens with validation
+        max_tokens = min(req.max_tokens, MAX_TOKENS_LIMIT)
+        
+        # Queue the request for the batch worker and wait for its result
+        job = GenerationJob(req.prompt, max_tokens, req.do_sample, req.temperature, req.top_p, req.session_id)
+        if req.stream:
+            job.streamer = TextIteratorStreamer(tokenizer, skip_prompt=True, skip_special_tokens=True)
+            ensure_batch_worker()
+            request_queue.put(job)
+            return StreamingResponse(stream_events(job), media_type="text/event-stream")
+        
+        return ORJSONResponse(await run_job(job, request))
         
     except Exception as e:
         logger.error(f"Error generating text: {str(e)}")
-        return jsonify({"error": f"Generation failed: {str(e)}"}), 500
+        return ORJSONResponse({"error": f"Generation failed: {str(e)}"}, status_code=500)
+
+@app.get("/warmup")
+async def warmup():
+    """Run a canonical generation, for readiness probes ahead of real traffic"""
+    if model is None or tokenizer is None:
+        return ORJSONResponse({"error": "Model not loaded"}, status_code=500)
+    
+    try:
+        start = time.monotonic()
+        await run_job(GenerationJob(WARMUP_PROMPT, WARMUP_MAX_TOKENS, False, 1.0, 1.0))
+        return {
+            "status": "ready",
+            "warmup_seconds": round(time.monotonic() - start, 3)
+        }
+        
+    except Exception as e:
+        logger.error(f"Warmup failed: {str(e)}")
+        return ORJSONResponse({"error": f"Warmup failed: {str(e)}"}, status_code=500)
 
-@app.route("/model-info", methods=["GET"])
-def model_info():
+@app.get("/model-info")
+async def model_info():
     """Get information about the loaded model"""
     if model is None or tokenizer is None:
-        return jsonify({"error": "Model not loaded"}), 500
+        return ORJSONResponse({"error": "Model not loaded"}, status_code=500)
+    
+    if BACKEND == "vllm":
+        dtype = model.llm_engine.model_config.dtype
+    else:
+        dtype = getattr(model, "dtype", torch.float32)
     
-    return jsonify({
+    return {
         "model_name": MODEL_NAME,
+        "backend": BACKEND,
+        "dtype": str(dtype).replace("torch.", ""),
+        "quantization": quantization,
         "vocab_size": tokenizer.vocab_size,
         "model_max_length": tokenizer.model_max_length,
         "pad_token": tokenizer.pad_token,
         "eos_token": tokenizer.eos_token
-    })
+    }
+
+# Load the model at import time, so servers that import app:app (uvicorn,
+# gunicorn with --preload) have it ready before accepting traffic
+try:
+    ensure_model_loaded()
+except Exception as e:
+    logger.error(f"Failed to start server: {str(e)}")
+    logger.error("Make sure you have internet connection and the model name is correct in .env file")
+    if __name__ == "__main__":
+        exit(1)
+    raise
 
 if __name__ == "__main__":
-    try:
-        # Load model on startup
-        load_model()
-        
-        logger.info(f"Starting server on {HOST}:{PORT}")
-        app.run(host=HOST, port=PORT, debug=False)
-        
-    except Exception as e:
-        logger.error(f"Failed to start server: {str(e)}")
-        logger.error("Make sure you have internet connection and the model name is correct in .env file")
-        exit(1) 
\ No newline at end of file
+    logger.info(f"Starting server on {HOST}:{PORT}")
+    # One worker since the model lives in-process; concurrency comes from
+    # the event loop and the batch worker. uvloop is used when installed.
+    uvicorn.run(app, host=HOST, port=PORT, workers=1, loop="auto")
@@ -0,0 +1,39 @@
+#!/usr/bin/env python3
+"""
+Export the configured model to an ONNX Runtime engine cached on disk
+"""
+
+import os
+import sys
+from dotenv import load_dotenv
+
+def engine_path(model_name, engine_dir):
+    """Directory the exported engine for model_name is cached in"""
+    return os.path.join(engine_dir, model_name.replace("/", "--"))
+
+def export_onnx(model_name, path, provider="CPUExecutionProvider"):
+    """Export model_name to ONNX, save it under path and return the loaded model"""
+    from optimum.onnxruntime import ORTModelForCausalLM
+
+    ort_model = ORTModelForCausalLM.from_pretrained(model_name, export=True, provider=provider)
+    ort_model.save_pretrained(path)
+    return ort_model
+
+def main():
+    load_dotenv()
+    model_name = os.getenv("model_name", "gpt2")
+    path = engine_path(model_name, os.getenv("ENGINE_DIR", "engine_cache"))
+
+    print(f"Exporting {model_name} to ONNX...")
+    try:
+        export_onnx(model_name, path)
+    except ImportError:
+        print("✗ optimum is not installed")
+        print("Install it with:")
+        print("  pip install optimum[onnxruntime]")
+        sys.exit(1)
+    print(f"✓ Engine saved to {path}")
+    print("\nTo serve it, set BACKEND=ort in your .env file")
+
+if __name__ == "__main__":
+    main()
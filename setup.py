@@ -1,6 +1,6 @@
 #!/usr/bin/env python3
 """
-Setup script for the Flask LLM API
+Setup script for the FastAPI LLM API
 """
 
 import os
@@ -25,7 +25,9 @@ def create_env_file():
 def install_basic_packages():
     """Install basic packages first"""
     basic_packages = [
-        'flask==2.3.3',
+        'fastapi==0.111.0',
+        'uvicorn[standard]==0.30.1',
+        'orjson==3.10.6',
         'python-dotenv==1.0.0',
         'requests==2.31.0'
     ]
@@ -49,7 +51,7 @@ def install_ml_packages():
     # Try to install torch first
     try:
         print("Installing PyTorch...")
-        subprocess.check_call([sys.executable, '-m', 'pip', 'install', 'torch==2.0.1', '--index-url', 'https://download.pytorch.org/whl/cpu'])
+        subprocess.check_call([sys.executable, '-m', 'pip', 'install', 'torch==2.4.0', '--index-url', 'https://download.pytorch.org/whl/cpu'])
         print("✓ PyTorch installed successfully")
     except subprocess.CalledProcessError:
         print("Trying alternative PyTorch installation...")
@@ -63,7 +65,7 @@ def install_ml_packages():
     # Try to install transformers
     try:
         print("Installing transformers...")
-        subprocess.check_call([sys.executable, '-m', 'pip', 'install', 'transformers==4.30.2'])
+        subprocess.check_call([sys.executable, '-m', 'pip', 'install', 'transformers==4.44.2'])
         print("✓ Transformers installed successfully")
     except subprocess.CalledProcessError:
         print("Trying alternative transformers installation...")
@@ -76,7 +78,7 @@ def install_ml_packages():
     
     # Try to install remaining packages
     remaining_packages = [
-        'accelerate==0.20.3',
+        'accelerate==0.33.0',
         'protobuf==3.20.3'
     ]
     
@@ -121,7 +123,9 @@ def test_basic_imports():
     """Test if basic imports work"""
     try:
         print("Testing basic imports...")
-        import flask
+        import fastapi
+        import uvicorn
+        import orjson
         import dotenv
         import requests
         print("✓ Basic imports successful")
@@ -140,7 +144,7 @@ def test_ml_imports():
         return True
     except ImportError as e:
         print(f"Warning: ML imports failed: {e}")
-        print("The basic Flask app will still work, but ML features may be limited")
+        print("The basic FastAPI app will still work, but ML features may be limited")
         return False
 
 def check_python_version():
@@ -161,7 +165,7 @@ def check_virtual_environment():
     return True
 
 def main():
-    print("Setting up Flask LLM API...")
+    print("Setting up FastAPI LLM API...")
     print("=" * 50)
     
     # Check Python version
@@ -181,7 +185,7 @@ def main():
         print("Installation encountered issues!")
         print("Try running these commands manually:")
         print("  pip install --upgrade pip")
-        print("  pip install flask python-dotenv requests")
+        print("  pip install fastapi uvicorn[standard] orjson python-dotenv requests")
         print("  pip install torch --index-url https://download.pytorch.org/whl/cpu")
         print("  pip install transformers")
         sys.exit(1)
@@ -1,6 +1,6 @@
 #!/usr/bin/env python3
 """
-Simple test script for the Flask LLM API
+Simple test script for the FastAPI LLM API
 """
 
 import requests
@@ -25,6 +25,14 @@ def test_model_info():
     print(f"Response: {response.json()}")
     print()
 
+def test_warmup():
+    """Test the warmup endpoint"""
+    print("Testing warmup...")
+    response = requests.get(f"{BASE_URL}/warmup")
+    print(f"Status: {response.status_code}")
+    print(f"Response: {response.json()}")
+    print()
+
 def test_generate(prompt, max_tokens=50, temperature=1.0):
     """Test the generate endpoint"""
     print(f"Testing text generation with prompt: '{prompt}'")
@@ -52,14 +60,42 @@ def test_generate(prompt, max_tokens=50, temperature=1.0):
         print(f"Error: {response.json()}")
     print()
 
+def test_generate_stream(prompt, max_tokens=50):
+    """Test the generate endpoint with streaming enabled"""
+    print(f"Testing streamed text generation with prompt: '{prompt}'")
+    
+    data = {
+        "prompt": prompt,
+        "max_tokens": max_tokens,
+        "stream": True
+    }
+    
+    response = requests.post(f"{BASE_URL}/generate", json=data, stream=True)
+    
+    print(f"Status: {response.status_code}")
+    print("Streamed text: ", end="")
+    for line in response.iter_lines(decode_unicode=True):
+        if not line.startswith("data: "):
+            continue
+        event = json.loads(line[len("data: "):])
+        if "token" in event:
+            print(event["token"], end="", flush=True)
+        elif event.get("done"):
+            print(f"\nTokens generated: {event['tokens_generated']}")
+        else:
+            print(f"\nError: {event}")
+    print()
+
 if __name__ == "__main__":
     # Test all endpoints
     test_health_check()
     test_model_info()
+    test_warmup()
     
     # Test text generation with different prompts
     test_generate("Once upon a time", max_tokens=100)
     test_generate("The future of AI is", max_tokens=75)
     test_generate("In a world where", max_tokens=50, temperature=0.8)
+    test_generate_stream("The quick brown fox", max_tokens=30)
     
     print("All tests completed!") 
\ No newline at end of file